@@ -1,15 +1,33 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+import time
+import importlib
+import os
+_INICIO_ARRANQUE = time.perf_counter()
+
+# Importamos primero, uno a uno, los módulos pesados para medir lo que cuesta cada uno.
+# Cada tiempo excluye lo ya cargado por los anteriores; los imports normales de abajo
+# los encuentran ya en caché.
+_importacion_ms = {}
+for _modulo in ("pydantic", "email_validator", "starlette.applications", "fastapi", "fastapi.security",
+                "models.Usuario", "models.Producto", "models.Prestamo", "services.Biblioteca"):
+    _inicio = time.perf_counter()
+    importlib.import_module(_modulo)
+    _importacion_ms[_modulo] = round((time.perf_counter() - _inicio) * 1000, 1)
+
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from typing import List, Optional
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
+from datetime import date, datetime, timedelta
 from contextlib import asynccontextmanager
 
-from services.Biblioteca import Biblioteca
-from models.Usuario import Usuario, UsuarioCreate, UsuarioRead
+from services.Biblioteca import Biblioteca, get_pwd_context
+from services.Limitador import LimitadorIntentos
+from models.Usuario import (
+    Usuario, UsuarioCreate, UsuarioRead,
+    SocioVencimientoRead, RenovacionLote, RenovacionLoteRead
+)
 from models.Producto import (
     Producto, Libro, DVD, CD, Ebook,
-    ProductoCreate, ProductoRead
+    ProductoCreate, ProductoRead, CodigosBusqueda, BusquedaCodigosRead
 )
 from models.Prestamo import PrestamoCreate, PrestamoRead, PrestamoItemRead
 
@@ -18,15 +36,92 @@ SECRET_KEY = "clave_secreta"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-app = FastAPI(title="API Gestión de Biblioteca")
+# --- LIMITACIÓN DE INTENTOS DE LOGIN ---
+# Configurable por variables de entorno. Por defecto:
+# por email 5 intentos seguidos y luego 1 por minuto; por IP 20 seguidos y luego 1 cada 3 segundos.
+# La IP es la del cliente real si uvicorn confía en el proxy (ver FORWARDED_ALLOW_IPS en el Dockerfile).
+LOGIN_EMAIL_CAPACIDAD = int(os.getenv("LOGIN_EMAIL_CAPACIDAD", "5"))
+LOGIN_EMAIL_SEGUNDOS_POR_INTENTO = float(os.getenv("LOGIN_EMAIL_SEGUNDOS_POR_INTENTO", "60"))
+LOGIN_IP_CAPACIDAD = int(os.getenv("LOGIN_IP_CAPACIDAD", "20"))
+LOGIN_IP_SEGUNDOS_POR_INTENTO = float(os.getenv("LOGIN_IP_SEGUNDOS_POR_INTENTO", "3"))
+
+limitador_email = LimitadorIntentos(capacidad=LOGIN_EMAIL_CAPACIDAD,
+                                    recarga_por_segundo=1 / LOGIN_EMAIL_SEGUNDOS_POR_INTENTO)
+limitador_ip = LimitadorIntentos(capacidad=LOGIN_IP_CAPACIDAD,
+                                 recarga_por_segundo=1 / LOGIN_IP_SEGUNDOS_POR_INTENTO)
+
+# --- ARRANQUE ---
+# Tiempos en milisegundos, consultables en /estado/arranque
+metricas_arranque = {
+    "importacion_ms": round((time.perf_counter() - _INICIO_ARRANQUE) * 1000, 1),
+    "importacion_por_modulo_ms": _importacion_ms,
+    "calentamiento_ms": {},
+    "primera_peticion_ms": None,
+}
+
+def _medir(nombre: str, funcion):
+    """Ejecuta un paso del calentamiento y guarda lo que ha tardado."""
+    inicio = time.perf_counter()
+    funcion()
+    metricas_arranque["calentamiento_ms"][nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+
+def _calentar_bcrypt():
+    # Importa passlib y fuerza la detección del backend de bcrypt. Su autocomprobación usa
+    # pocas rondas, así que no pagamos un hash completo en cada arranque en frío.
+    get_pwd_context().handler().get_backend()
+
+def _calentar_jwt():
+    # Importa python-jose y su backend criptográfico
+    from jose import jwt
+    jwt.decode(create_access_token({"sub": "calentamiento"}), SECRET_KEY, algorithms=[ALGORITHM])
+
+def _calentar_serializadores():
+    # Primera validación de los esquemas de respuesta más usados
+    mapear_producto(Libro("calentamiento", "calentamiento", 0, 1, "calentamiento", "0"))
+    UsuarioRead(id="0", nombre="calentamiento", email="calentamiento@example.com", es_bibliotecario=False)
+    PrestamoRead(id="0", usuario_id="0", nombre_usuario="calentamiento", fecha_inicio="", fecha_devolucion="",
+                 devuelto=False, items=[PrestamoItemRead(producto_id="0", titulo="", cantidad=0, tipo="")])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Calienta los módulos pesados antes de aceptar la primera petición."""
+    _medir("bcrypt", _calentar_bcrypt)
+    _medir("jwt", _calentar_jwt)
+    _medir("serializadores", _calentar_serializadores)
+    metricas_arranque["listo_ms"] = round((time.perf_counter() - _INICIO_ARRANQUE) * 1000, 1)
+    biblioteca.eventos.iniciar()
+    yield
+    biblioteca.eventos.detener() # Vuelca a disco los eventos pendientes
+
+app = FastAPI(title="API Gestión de Biblioteca", lifespan=lifespan)
 biblioteca = Biblioteca() # Instancia única del servicio
 
 # Configuración de seguridad (OAuth2)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+class MedirPrimeraPeticion:
+    """
+    Middleware ASGI puro que anota el tiempo desde el arranque hasta la primera petición HTTP.
+    A partir de ahí solo comprueba un booleano y delega, sin envolver la respuesta.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pendiente = True
+
+    async def __call__(self, scope, receive, send):
+        if self.pendiente and scope["type"] == "http":
+            self.pendiente = False
+            metricas_arranque["primera_peticion_ms"] = round((time.perf_counter() - _INICIO_ARRANQUE) * 1000, 1)
+        await self.app(scope, receive, send)
+
+app.add_middleware(MedirPrimeraPeticion)
+
 # --- UTILIDADES JWT ---
+# python-jose se importa dentro de las funciones para no pagar su carga al importar main
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -41,6 +136,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Credenciales inválidas",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -49,8 +145,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
         
-    # Buscamos el usuario por email manualmente en la lista
-    user = next((u for u in biblioteca.usuarios if u.email == email), None)
+    user = biblioteca.buscar_usuario_por_email(email)
     if user is None:
         raise credentials_exception
     return user
@@ -58,15 +153,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 # ============================= ENDPOINTS AUTENTICACIÓN =============================
 
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """Login para obtener el token JWT."""
-    user = biblioteca.autenticar_usuario(form_data.username, form_data.password)
+    # Rechazamos el exceso de intentos antes de hacer ningún cálculo de bcrypt
+    email = form_data.username.lower()
+    # Con --proxy-headers, uvicorn ya sustituye client.host por la IP de X-Forwarded-For
+    ip = request.client.host if request.client else "desconocida"
+    espera = limitador_ip.consumir(ip) or limitador_email.consumir(email)
+    if espera:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos de login. Inténtalo más tarde.",
+            headers={"Retry-After": str(int(espera) + 1)},
+        )
+
+    user = await biblioteca.autenticar_usuario(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuario o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    limitador_email.reiniciar(email)
     
     access_token = create_access_token(
         data={"sub": user.email, "rol": "bibliotecario" if user.es_bibliotecario() else "socio"}
@@ -74,7 +182,7 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=UsuarioRead)
-def read_users_me(current_user: Usuario = Depends(get_current_user)):
+async def read_users_me(current_user: Usuario = Depends(get_current_user)):
     """Ver mis datos (Protegido)."""
     return UsuarioRead(
         id=current_user.id,
@@ -84,12 +192,22 @@ def read_users_me(current_user: Usuario = Depends(get_current_user)):
         es_bibliotecario=current_user.es_bibliotecario()
     )
 
+@app.get("/estado/arranque")
+async def estado_arranque(current_user: Usuario = Depends(get_current_user)):
+    """
+    Tiempos de arranque (ms): importación total y por módulo, calentamiento y primera petición.
+    Solo bibliotecarios.
+    """
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    return metricas_arranque
+
 # ============================= ENDPOINTS USUARIOS =============================
 
 @app.post("/usuarios", response_model=UsuarioRead, status_code=201)
-def registrar_usuario(usuario: UsuarioCreate):
+async def registrar_usuario(usuario: UsuarioCreate):
     try:
-        nuevo = biblioteca.registrar_usuario(
+        nuevo = await biblioteca.registrar_usuario(
             tipo=usuario.tipo,
             nombre=usuario.nombre,
             email=usuario.email,
@@ -106,7 +224,7 @@ def registrar_usuario(usuario: UsuarioCreate):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/usuarios", response_model=List[UsuarioRead])
-def listar_usuarios():
+async def listar_usuarios():
     usuarios = biblioteca.listar_usuarios()
     return [
         UsuarioRead(id=u.id, nombre=u.nombre, email=u.email, edad=u.edad, es_bibliotecario=u.es_bibliotecario())
@@ -114,7 +232,7 @@ def listar_usuarios():
     ]
     
 @app.delete("/usuarios/{usuario_id}", status_code=204)
-def dar_de_baja_usuario(usuario_id: str, current_user: Usuario = Depends(get_current_user)):
+async def dar_de_baja_usuario(usuario_id: str, current_user: Usuario = Depends(get_current_user)):
     """
     Elimina un usuario del sistema.
     Solo un bibliotecario puede realizar esta acción.
@@ -129,7 +247,7 @@ def dar_de_baja_usuario(usuario_id: str, current_user: Usuario = Depends(get_cur
     return
 
 @app.put("/usuarios/{socio_id}/renovar", response_model=UsuarioRead)
-def renovar_suscripcion(socio_id: str, current_user: Usuario = Depends(get_current_user)):
+async def renovar_suscripcion(socio_id: str, current_user: Usuario = Depends(get_current_user)):
     """
     Renueva la suscripción de un socio por 2 años más.
     Solo bibliotecarios pueden hacerlo.
@@ -149,7 +267,38 @@ def renovar_suscripcion(socio_id: str, current_user: Usuario = Depends(get_curre
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+def mapear_vencimiento(socio):
+    return SocioVencimientoRead(
+        id=socio.id, nombre=socio.nombre, email=socio.email,
+        fecha_renovacion=socio.fecha_renovacion.strftime('%Y-%m-%d')
+    )
 
+@app.get("/usuarios/vencimientos", response_model=List[SocioVencimientoRead])
+async def socios_por_vencer(dias: int = 30, incluir_vencidos: bool = False,
+                            current_user: Usuario = Depends(get_current_user)):
+    """
+    Socios cuya suscripción vence en los próximos N días, del más próximo al más lejano.
+    Query params: ?dias=30&incluir_vencidos=true
+    Solo bibliotecarios.
+    """
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    return [mapear_vencimiento(s) for s in biblioteca.socios_por_vencer(dias, incluir_vencidos)]
+
+@app.post("/usuarios/renovar", response_model=RenovacionLoteRead)
+async def renovar_suscripciones(lote: RenovacionLote, current_user: Usuario = Depends(get_current_user)):
+    """
+    Renueva varios socios en una sola petición (los ids repetidos cuentan una vez).
+    Solo bibliotecarios.
+    """
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Solo bibliotecarios pueden renovar suscripciones.")
+
+    renovados, no_encontrados = biblioteca.renovar_socios(lote.socio_ids)
+    return RenovacionLoteRead(
+        renovados=[mapear_vencimiento(s) for s in renovados],
+        no_encontrados=no_encontrados
+    )
 
 # ============================= ENDPOINTS PRODUCTOS =============================
 
@@ -173,12 +322,49 @@ def mapear_producto(prod):
     )
 
 @app.get("/productos", response_model=List[ProductoRead])
-def listar_productos():
+async def listar_productos():
     prods = biblioteca.listar_productos()
     return [mapear_producto(p) for p in prods]
 
+@app.get("/productos/isbn/{isbn}", response_model=ProductoRead)
+async def buscar_por_isbn(isbn: str):
+    """
+    Busca un libro por ISBN-10 o ISBN-13 (se admiten guiones).
+    Los libros dados de alta con un ISBN inválido (dígito de control erróneo) no se indexan.
+    """
+    prod = biblioteca.buscar_producto_por_isbn(isbn)
+    if not prod:
+        raise HTTPException(status_code=404, detail="Producto no encontrado.")
+    return mapear_producto(prod)
+
+@app.get("/productos/upc/{codigo}", response_model=ProductoRead)
+async def buscar_por_upc(codigo: str):
+    """
+    Busca un CD por código UPC-A o EAN-13.
+    Los CDs dados de alta con un código inválido (dígito de control erróneo) no se indexan.
+    """
+    prod = biblioteca.buscar_producto_por_upc(codigo)
+    if not prod:
+        raise HTTPException(status_code=404, detail="Producto no encontrado.")
+    return mapear_producto(prod)
+
+@app.post("/productos/codigos", response_model=BusquedaCodigosRead)
+async def buscar_por_codigos(busqueda: CodigosBusqueda):
+    """
+    Busca muchos códigos de barras (ISBN o UPC/EAN) en una sola petición.
+    Los productos dados de alta con un código inválido no se indexan y no aparecen aquí.
+    """
+    encontrados = {}
+    no_encontrados = []
+    for codigo, prod in biblioteca.buscar_productos_por_codigos(busqueda.codigos).items():
+        if prod:
+            encontrados[codigo] = mapear_producto(prod)
+        else:
+            no_encontrados.append(codigo)
+    return BusquedaCodigosRead(encontrados=encontrados, no_encontrados=no_encontrados)
+
 @app.post("/productos", response_model=ProductoRead, status_code=201)
-def crear_producto(p: ProductoCreate, current_user: Usuario = Depends(get_current_user)):
+async def crear_producto(p: ProductoCreate, current_user: Usuario = Depends(get_current_user)):
     """Solo bibliotecarios pueden añadir productos."""
     if not current_user.es_bibliotecario():
         raise HTTPException(status_code=403, detail="Permiso denegado: Solo bibliotecarios.")
@@ -202,7 +388,7 @@ def crear_producto(p: ProductoCreate, current_user: Usuario = Depends(get_curren
          raise HTTPException(status_code=400, detail=str(e))
      
 @app.delete("/productos/{producto_id}", status_code=204)
-def eliminar_producto(producto_id: str, current_user: Usuario = Depends(get_current_user)):
+async def eliminar_producto(producto_id: str, current_user: Usuario = Depends(get_current_user)):
     """
     Elimina un producto del catálogo.
     Solo bibliotecarios.
@@ -218,7 +404,7 @@ def eliminar_producto(producto_id: str, current_user: Usuario = Depends(get_curr
 # ============================= ENDPOINTS PRÉSTAMOS =============================
 
 @app.post("/prestamos", response_model=PrestamoRead, status_code=201)
-def crear_prestamo(prestamo_data: PrestamoCreate, current_user: Usuario = Depends(get_current_user)):
+async def crear_prestamo(prestamo_data: PrestamoCreate, current_user: Usuario = Depends(get_current_user)):
     """Crea un préstamo. Verifica que seas tú mismo o un bibliotecario."""
     
     # Seguridad: Solo puedes pedir préstamos para ti mismo (salvo que seas bibliotecario)
@@ -226,10 +412,11 @@ def crear_prestamo(prestamo_data: PrestamoCreate, current_user: Usuario = Depend
         raise HTTPException(status_code=403, detail="No puedes crear préstamos para otros usuarios.")
 
     try:
-        # Recuperar objetos producto reales
+        # Recuperar objetos producto reales (todos en una sola búsqueda)
+        productos = biblioteca.buscar_productos_por_ids([item.producto_id for item in prestamo_data.items])
         items_obj = []
         for item in prestamo_data.items:
-            prod = biblioteca.buscar_producto_por_id(item.producto_id)
+            prod = productos.get(item.producto_id)
             if not prod:
                 raise HTTPException(status_code=404, detail=f"Producto {item.producto_id} no encontrado")
             items_obj.append((prod, item.cantidad))
@@ -256,7 +443,7 @@ def crear_prestamo(prestamo_data: PrestamoCreate, current_user: Usuario = Depend
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/users/me/prestamos", response_model=List[PrestamoRead])
-def mis_prestamos(current_user: Usuario = Depends(get_current_user)):
+async def mis_prestamos(current_user: Usuario = Depends(get_current_user)):
     """Ver mis propios préstamos."""
     prestamos = biblioteca.listar_prestamos_por_usuario(current_user.id)
     
@@ -278,7 +465,7 @@ def mis_prestamos(current_user: Usuario = Depends(get_current_user)):
     return resultado
 
 @app.put("/prestamos/{prestamo_id}/devolver")
-def devolver_prestamo(prestamo_id: str, current_user: Usuario = Depends(get_current_user)):
+async def devolver_prestamo(prestamo_id: str, current_user: Usuario = Depends(get_current_user)):
     """
     Marca un préstamo como devuelto y recupera el stock.
     Accesible para el propio usuario o bibliotecarios.
@@ -292,7 +479,7 @@ def devolver_prestamo(prestamo_id: str, current_user: Usuario = Depends(get_curr
     
 
 @app.put("/prestamos/{prestamo_id}/ampliar")
-def ampliar_prestamo(prestamo_id: str, dias: int, current_user: Usuario = Depends(get_current_user)):
+async def ampliar_prestamo(prestamo_id: str, dias: int, current_user: Usuario = Depends(get_current_user)):
     """
     Amplía la fecha de devolución de un préstamo.
     Query param: ?dias=7
@@ -310,3 +497,57 @@ def ampliar_prestamo(prestamo_id: str, dias: int, current_user: Usuario = Depend
         raise HTTPException(status_code=404, detail=str(e))
 
 
+# ============================= ENDPOINTS ESTADÍSTICAS =============================
+
+@app.get("/estadisticas/mas-prestados")
+async def mas_prestados(limite: int = 10, desde: Optional[date] = None, hasta: Optional[date] = None,
+                        current_user: Usuario = Depends(get_current_user)):
+    """
+    Productos más prestados. Query params opcionales: ?desde=2025-01-01&hasta=2025-01-31
+    Solo bibliotecarios.
+    """
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    return biblioteca.estadisticas.mas_prestados(limite, desde, hasta)
+
+@app.get("/estadisticas/prestamos-por-dia")
+async def prestamos_por_dia(agrupacion: str = "tipo", desde: Optional[date] = None, hasta: Optional[date] = None,
+                            current_user: Usuario = Depends(get_current_user)):
+    """
+    Unidades prestadas por día, agrupadas por tipo o por género.
+    Query params: ?agrupacion=genero&desde=2025-01-01&hasta=2025-01-31
+    """
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    try:
+        return biblioteca.estadisticas.prestamos_por_dia(agrupacion, desde, hasta)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/estadisticas/duracion-media")
+async def duracion_media(current_user: Usuario = Depends(get_current_user)):
+    """Duración media de los préstamos devueltos. Solo bibliotecarios."""
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    return biblioteca.estadisticas.duracion_media()
+
+@app.get("/estadisticas/rechazos-edad")
+async def rechazos_edad(current_user: Usuario = Depends(get_current_user)):
+    """Préstamos de DVD rechazados por edad insuficiente. Solo bibliotecarios."""
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    return biblioteca.estadisticas.rechazos_edad()
+
+# ============================= ENDPOINTS AUDITORÍA =============================
+
+@app.get("/eventos")
+async def consultar_eventos(entidad_id: Optional[str] = None, limite: int = 50,
+                            current_user: Usuario = Depends(get_current_user)):
+    """
+    Últimos eventos de auditoría, opcionalmente de una entidad (usuario, producto o préstamo).
+    Query params: ?entidad_id=...&limite=50
+    Solo bibliotecarios.
+    """
+    if not current_user.es_bibliotecario():
+        raise HTTPException(status_code=403, detail="Permiso denegado.")
+    return biblioteca.eventos.consultar(entidad_id, limite)
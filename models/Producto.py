@@ -1,5 +1,5 @@
 import uuid
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
 class Producto:
@@ -48,6 +48,15 @@ class DVD(Producto):
         super().__init__(titulo, autor, cantidad)
         self.duracion_min = duracion_min
         self.clasificacion = clasificacion
+        self.edad_minima = self._parsear_edad_minima(clasificacion) # Se calcula una sola vez
+
+    @staticmethod
+    def _parsear_edad_minima(clasificacion: Optional[str]) -> Optional[int]:
+        """Convierte '+18' o '12' en la edad mínima; None si no es numérica (p. ej. 'TP')."""
+        try:
+            return int(clasificacion.strip().lstrip("+"))
+        except (AttributeError, ValueError):
+            return None
 
     def __str__(self) -> str:
         return (f"{super().__str__()}\nDuración: {self.duracion_min} min\nClasificación: {self.clasificacion}")
@@ -140,4 +149,18 @@ class ProductoRead(BaseModel):
                 "cantidad": 5,
                 "genero": "Distopía"
             }
-        }
\ No newline at end of file
+        }
+
+class CodigosBusqueda(BaseModel):
+    codigos: List[str] # ISBN-10, ISBN-13, UPC-A o EAN-13
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "codigos": ["978-0-451-52493-5", "0451524934", "036000291452"]
+            }
+        }
+
+class BusquedaCodigosRead(BaseModel):
+    encontrados: Dict[str, ProductoRead]
+    no_encontrados: List[str]
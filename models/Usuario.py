@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime, timedelta
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 
 class Usuario:
     """
@@ -90,3 +90,26 @@ class UsuarioRead(BaseModel):
                 "es_bibliotecario": False
             }
         }
+
+class SocioVencimientoRead(BaseModel):
+    id: str
+    nombre: str
+    email: EmailStr
+    fecha_renovacion: str
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "id": "123e4567-e89b-12d3-a456-426614174000",
+                "nombre": "Ana Pérez",
+                "email": "ana@email.com",
+                "fecha_renovacion": "2026-11-02"
+            }
+        }
+
+class RenovacionLote(BaseModel):
+    socio_ids: List[str]
+
+class RenovacionLoteRead(BaseModel):
+    renovados: List[SocioVencimientoRead]
+    no_encontrados: List[str]
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_REINTENTO = 60.0 # Segundos máximos entre reintentos tras un error de escritura
+
+
+class RegistroEventos:
+    """
+    Registro de auditoría de los cambios de estado de la biblioteca.
+
+    `emitir` solo encola el evento en memoria (buffer circular) y actualiza un índice
+    por entidad; un hilo en segundo plano vacía el buffer por lotes a ficheros NDJSON
+    rotativos, de modo que las peticiones nunca esperan a disco.
+    """
+
+    def __init__(self, directorio: str = "logs", capacidad: int = 10000, tam_lote: int = 500,
+                 intervalo: float = 1.0, max_bytes: int = 10 * 1024 * 1024, max_ficheros: int = 5,
+                 recientes: int = 5000, max_entidades: int = 10000, por_entidad: int = 100):
+        """
+        :param directorio: Carpeta donde se escriben los ficheros eventos.ndjson
+        :param capacidad: Tamaño del buffer pendiente de escribir (se descartan los más antiguos)
+        :param tam_lote: Eventos escritos por cada llamada a disco
+        :param intervalo: Segundos máximos entre volcados
+        :param max_bytes: Tamaño a partir del cual se rota el fichero
+        :param max_ficheros: Número de ficheros rotados que se conservan
+        :param recientes: Eventos recientes que se guardan en memoria para consultas
+        :param max_entidades: Entidades distintas que mantiene el índice (LRU)
+        :param por_entidad: Eventos recientes guardados por cada entidad
+        """
+        self.directorio = directorio
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.max_bytes = max_bytes
+        self.max_ficheros = max_ficheros
+        self.max_entidades = max_entidades
+        self.por_entidad = por_entidad
+
+        self._pendientes: deque = deque(maxlen=capacidad)
+        self._recientes: deque = deque(maxlen=recientes)
+        self._por_entidad: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.descartados = 0  # Eventos perdidos antes de escribirse (buffer lleno o error al parar)
+
+        self._hay_eventos = threading.Event()
+        self._parar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    # ==================== EMISIÓN ====================
+
+    def emitir(self, accion: str, entidad_id: str, relacionados: Iterable[str] = (), **datos):
+        """Registra un evento sobre `entidad_id` (y lo indexa también por `relacionados`)."""
+        evento = {
+            "ts": datetime.now().isoformat(),
+            "accion": accion,
+            "entidad_id": entidad_id,
+            "datos": datos,
+        }
+        with self._lock:
+            if len(self._pendientes) == self._pendientes.maxlen:
+                self.descartados += 1
+            self._pendientes.append(evento)
+            self._recientes.append(evento)
+            for clave in (entidad_id, *relacionados):
+                self._indexar(clave, evento)
+            lote_completo = len(self._pendientes) >= self.tam_lote
+        # Solo despertamos al escritor con un lote completo; si no, vuelca al cumplirse `intervalo`
+        if lote_completo:
+            self._hay_eventos.set()
+
+    def _indexar(self, clave: str, evento: dict):
+        cola = self._por_entidad.get(clave)
+        if cola is None:
+            cola = deque(maxlen=self.por_entidad)
+            self._por_entidad[clave] = cola
+            if len(self._por_entidad) > self.max_entidades:
+                self._por_entidad.popitem(last=False)
+        else:
+            self._por_entidad.move_to_end(clave)
+        cola.append(evento)
+
+    # ==================== CONSULTA ====================
+
+    def consultar(self, entidad_id: Optional[str] = None, limite: int = 50) -> List[dict]:
+        """Últimos eventos (de una entidad si se indica), del más antiguo al más reciente."""
+        with self._lock:
+            if entidad_id is None:
+                origen = self._recientes
+            else:
+                origen = self._por_entidad.get(entidad_id, ())
+            eventos = list(origen)
+        return eventos[-limite:] if limite > 0 else []
+
+    # ==================== ESCRITOR EN SEGUNDO PLANO ====================
+
+    def iniciar(self):
+        """Arranca el hilo que escribe los eventos en disco."""
+        if self._hilo is not None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="auditoria", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        """Detiene el hilo escritor tras volcar los eventos pendientes."""
+        if self._hilo is None:
+            return
+        self._parar.set()
+        self._hay_eventos.set()
+        self._hilo.join()
+        self._hilo = None
+
+    def _bucle(self):
+        reintento = self.intervalo
+        while not self._parar.is_set():
+            self._hay_eventos.wait(self.intervalo)
+            self._hay_eventos.clear()
+            try:
+                self._volcar()
+                reintento = self.intervalo
+            except Exception:
+                # El lote ya ha vuelto al buffer: esperamos (cada vez más) y reintentamos
+                logger.exception("Error escribiendo eventos de auditoría; reintento en %.0f s", reintento)
+                self._parar.wait(reintento)
+                reintento = min(reintento * 2, MAX_REINTENTO)
+
+        try:
+            self._volcar()
+        except Exception:
+            with self._lock:
+                perdidos = len(self._pendientes)
+                self.descartados += perdidos
+                self._pendientes.clear()
+            logger.exception("Error en el volcado final de auditoría; se pierden %d eventos", perdidos)
+
+    def _volcar(self):
+        """Escribe todos los eventos pendientes en lotes de `tam_lote`."""
+        while True:
+            lote = []
+            with self._lock:
+                while self._pendientes and len(lote) < self.tam_lote:
+                    lote.append(self._pendientes.popleft())
+            if not lote:
+                return
+            try:
+                lineas = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in lote)
+                self._escribir(lineas)
+            except Exception:
+                self._devolver(lote)
+                raise
+
+    def _devolver(self, lote: List[dict]):
+        """Vuelve a poner un lote no escrito al principio del buffer, en su orden original."""
+        with self._lock:
+            sobran = len(self._pendientes) + len(lote) - self._pendientes.maxlen
+            if sobran > 0:
+                # Si no cabe todo, se pierden los más antiguos del lote
+                self.descartados += sobran
+                lote = lote[sobran:]
+            self._pendientes.extendleft(reversed(lote))
+
+    def _ruta(self, numero: int = 0) -> str:
+        nombre = "eventos.ndjson" if numero == 0 else f"eventos.ndjson.{numero}"
+        return os.path.join(self.directorio, nombre)
+
+    def _escribir(self, lineas: str):
+        ruta = self._ruta()
+        if os.path.exists(ruta) and os.path.getsize(ruta) >= self.max_bytes:
+            self._rotar()
+        with open(ruta, "a", encoding="utf-8") as f:
+            f.write(lineas)
+
+    def _rotar(self):
+        """eventos.ndjson -> .1 -> .2 ... descartando el más antiguo."""
+        for numero in range(self.max_ficheros - 1, 0, -1):
+            origen = self._ruta(numero)
+            if os.path.exists(origen):
+                os.replace(origen, self._ruta(numero + 1))
+        os.replace(self._ruta(), self._ruta(1))
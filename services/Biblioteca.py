@@ -1,83 +1,162 @@
-from typing import List, Tuple
+import asyncio
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from passlib.context import CryptContext  # pip install passlib[bcrypt]
 
-from models.Producto import Producto, DVD
+from models.Producto import Producto, DVD, Libro, CD
 from models.Usuario import Usuario, Socio, Bibliotecario
 from models.Prestamo import Prestamo
-
-# Configuración de hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from services.Auditoria import RegistroEventos
+from services.Estadisticas import EstadisticasPrestamos
+from services.Identificadores import normalizar_isbn, normalizar_upc
+from services.Instantaneas import ColeccionVersionada, Instantanea
+from services.Vencimientos import IndiceVencimientos
+
+# Configuración de hashing (se crea bajo demanda: importar passlib/bcrypt es caro)
+_pwd_context = None
+
+def get_pwd_context():
+    """Devuelve el CryptContext de bcrypt, importándolo la primera vez."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext  # pip install passlib[bcrypt]
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 class Biblioteca:
     """Clase que centraliza la gestión de usuarios, productos y préstamos para la API REST."""
 
     def __init__(self):
-        self.usuarios: List[Usuario] = []
-        self.productos: List[Producto] = []
-        self.prestamos: List[Prestamo] = []
+        # Colecciones copy-on-write: las lecturas ven siempre una versión completa
+        self._usuarios = ColeccionVersionada()
+        self._productos = ColeccionVersionada()
+        self._prestamos = ColeccionVersionada()
+        # Índices de usuarios para búsquedas O(1)
+        self._usuario_por_id: Dict[str, Usuario] = {}
+        self._usuario_por_email: Dict[str, Usuario] = {}
+        self.estadisticas = EstadisticasPrestamos()
+        self.eventos = RegistroEventos()
+        self._producto_por_id: Dict[str, Producto] = {}
+        # Índices por código normalizado (ISBN-13 / EAN-13) -> productos con ese código
+        self._por_isbn: Dict[str, List[Producto]] = {}
+        self._por_upc: Dict[str, List[Producto]] = {}
+        self.vencimientos = IndiceVencimientos()
+
+    @property
+    def usuarios(self) -> Instantanea:
+        return self._usuarios.instantanea()
+
+    @property
+    def productos(self) -> Instantanea:
+        return self._productos.instantanea()
+
+    @property
+    def prestamos(self) -> Instantanea:
+        return self._prestamos.instantanea()
 
     # ==================== USUARIOS ====================
 
-    def registrar_usuario(self, tipo: str, nombre: str, email: str, edad: int, 
-                          contrasena: str, numero_empleado: str = None, turno: str = None) -> Usuario:
-        """Registra un nuevo usuario hasheando su contraseña."""
-        
+    async def registrar_usuario(self, tipo: str, nombre: str, email: str, edad: int,
+                                contrasena: str, numero_empleado: str = None, turno: str = None) -> Usuario:
+        """Registra un nuevo usuario hasheando su contraseña (bcrypt se calcula en un hilo aparte)."""
+        self._validar_registro(tipo, nombre, email, edad, contrasena, numero_empleado, turno)
+        contrasena_hash = await asyncio.to_thread(get_pwd_context().hash, contrasena)
+        return self._guardar_usuario(tipo, nombre, email, edad, contrasena_hash, numero_empleado, turno)
+
+    def _validar_registro(self, tipo, nombre, email, edad, contrasena, numero_empleado, turno):
+        """Comprobaciones previas al hash, para no gastar bcrypt en registros inválidos."""
         # Validaciones básicas
         if not nombre or not email or edad is None or not contrasena:
             raise ValueError("Faltan campos obligatorios (nombre, email, edad, contraseña).")
 
-        # Comprobar duplicados
-        for u in self.usuarios:
-            if u.email == email:
-                raise ValueError(f"Ya existe un usuario con el correo {email}.")
+        if tipo.lower() == "bibliotecario":
+            if not numero_empleado or not turno:
+                raise ValueError("Faltan número de empleado o turno para bibliotecario.")
+        elif tipo.lower() != "socio":
+            raise ValueError("Tipo de usuario no válido. Debe ser 'socio' o 'bibliotecario'.")
+
+        self._comprobar_email_libre(email)
 
-        # Hashear contraseña
-        contrasena_hash = pwd_context.hash(contrasena)
+    def _comprobar_email_libre(self, email: str):
+        if email in self._usuario_por_email:
+            raise ValueError(f"Ya existe un usuario con el correo {email}.")
+
+    def _guardar_usuario(self, tipo, nombre, email, edad, contrasena_hash, numero_empleado, turno) -> Usuario:
+        # Volvemos a comprobar duplicados: otro registro pudo entrar mientras se calculaba el hash
+        self._comprobar_email_libre(email)
 
         if tipo.lower() == "socio":
             usuario = Socio(nombre, email, edad, contrasena_hash)
-        elif tipo.lower() == "bibliotecario":
-            if not numero_empleado or not turno:
-                raise ValueError("Faltan número de empleado o turno para bibliotecario.")
-            usuario = Bibliotecario(nombre, email, edad, contrasena_hash, numero_empleado, turno)
         else:
-            raise ValueError("Tipo de usuario no válido. Debe ser 'socio' o 'bibliotecario'.")
+            usuario = Bibliotecario(nombre, email, edad, contrasena_hash, numero_empleado, turno)
 
-        self.usuarios.append(usuario)
+        self._usuarios.añadir(usuario)
+        self._usuario_por_id[usuario.id] = usuario
+        self._usuario_por_email[usuario.email] = usuario
+        if isinstance(usuario, Socio):
+            self.vencimientos.añadir(usuario)
+        self.eventos.emitir("usuario_registrado", usuario.id, tipo=tipo.lower(), email=email)
         return usuario
 
-    def autenticar_usuario(self, email: str, contrasena_plana: str) -> Usuario | None:
-        """Verifica credenciales para el login."""
-        for u in self.usuarios:
-            # Verificamos hash
-            if pwd_context.verify(contrasena_plana, u.contrasena):
-                return u
+    async def autenticar_usuario(self, email: str, contrasena_plana: str) -> Usuario | None:
+        """Verifica credenciales para el login (el hash se comprueba en un hilo aparte)."""
+        # Buscamos primero por email para calcular bcrypt una sola vez como mucho
+        usuario = self.buscar_usuario_por_email(email)
+        if usuario is None:
+            return None
+        if await asyncio.to_thread(get_pwd_context().verify, contrasena_plana, usuario.contrasena):
+            return usuario
         return None
 
     def dar_de_baja_usuario(self, usuario_id: str):
         """Elimina un usuario por ID."""
-        for u in self.usuarios:
-            if u.id == usuario_id:
-                self.usuarios.remove(u)
-                return True # Éxito
-        return False # No encontrado
+        # Búsqueda y borrado atómicos: dos bajas simultáneas del mismo id no fallan
+        u = self._usuarios.eliminar_si(lambda u: u.id == usuario_id)
+        if u is None:
+            return False # No encontrado
+        self._usuario_por_id.pop(u.id, None)
+        self._usuario_por_email.pop(u.email, None)
+        if isinstance(u, Socio):
+            self.vencimientos.eliminar(u)
+        self.eventos.emitir("usuario_eliminado", usuario_id, email=u.email)
+        return True # Éxito
 
     def renovar_socio(self, socio_id: str):
         """Renueva suscripción de socio (lógica de negocio)."""
-        for u in self.usuarios:
-            if isinstance(u, Socio) and u.id == socio_id:
-                u.renovar_suscripcion()
-                return u # Devolvemos el usuario actualizado
-        raise ValueError("Socio no encontrado")
+        socio = self.vencimientos.obtener(socio_id)
+        if socio is None:
+            raise ValueError("Socio no encontrado")
+        fecha_anterior = socio.fecha_renovacion
+        socio.renovar_suscripcion()
+        self.vencimientos.actualizar(socio, fecha_anterior)
+        self.eventos.emitir("socio_renovado", socio_id, fecha_renovacion=socio.fecha_renovacion)
+        return socio # Devolvemos el usuario actualizado
+
+    def renovar_socios(self, socio_ids: List[str]) -> Tuple[List[Socio], List[str]]:
+        """
+        Renueva varios socios de una vez. Devuelve (renovados, ids no encontrados).
+        Los ids repetidos se renuevan una sola vez.
+        """
+        renovados, no_encontrados = [], []
+        for socio_id in dict.fromkeys(socio_ids): # Quita repetidos conservando el orden
+            try:
+                renovados.append(self.renovar_socio(socio_id))
+            except ValueError:
+                no_encontrados.append(socio_id)
+        return renovados, no_encontrados
+
+    def socios_por_vencer(self, dias: int, incluir_vencidos: bool = False) -> List[Socio]:
+        """Socios cuya suscripción vence en los próximos `dias` días (y los ya vencidos si se pide)."""
+        ahora = datetime.now()
+        return self.vencimientos.entre(None if incluir_vencidos else ahora, ahora + timedelta(days=dias))
 
     def buscar_usuario_por_id(self, usuario_id: str):
-        for u in self.usuarios:
-            if u.id == usuario_id:
-                return u
-        return None
+        return self._usuario_por_id.get(usuario_id)
+
+    def buscar_usuario_por_email(self, email: str):
+        return self._usuario_por_email.get(email)
 
-    def listar_usuarios(self):
+    def listar_usuarios(self) -> Instantanea:
+        """Devuelve la instantánea actual de usuarios (inmutable)."""
         return self.usuarios
 
     # ==================== PRODUCTOS ====================
@@ -94,37 +173,51 @@ class Biblioteca:
                 type(p) == type(producto)):
                 
                 p.cantidad += producto.cantidad
+                self.eventos.emitir("stock_ajustado", p.id, cantidad=producto.cantidad, stock=p.cantidad)
                 return p # Devolvemos el producto actualizado
 
-        self.productos.append(producto)
+        self._productos.añadir(producto)
+        self._producto_por_id[producto.id] = producto
+        self._indexar_codigos(producto)
+        self.eventos.emitir("producto_creado", producto.id, tipo=type(producto).__name__,
+                            titulo=producto.titulo, stock=producto.cantidad)
         return producto
 
     def eliminar_producto(self, producto_id: str):
-        for p in self.productos:
-            if p.id == producto_id:
-                self.productos.remove(p)
-                return True
-        return False
+        p = self._productos.eliminar_si(lambda p: p.id == producto_id)
+        if p is None:
+            return False
+        self._producto_por_id.pop(p.id, None)
+        self._desindexar_codigos(p)
+        self.eventos.emitir("producto_eliminado", producto_id, titulo=p.titulo)
+        return True
 
     def ajustar_stock(self, producto_id: str, cantidad: int):
-        for p in self.productos:
-            if p.id == producto_id:
-                if cantidad < 0 and abs(cantidad) > p.cantidad:
-                     raise ValueError("No hay suficiente stock para reducir")
-                p.cantidad += cantidad
-                return p
-        raise ValueError("Producto no encontrado")
-
-    def listar_productos(self):
-        """Devuelve la lista pura de productos."""
+        p = self._producto_por_id.get(producto_id)
+        if p is None:
+            raise ValueError("Producto no encontrado")
+        if cantidad < 0 and abs(cantidad) > p.cantidad:
+            raise ValueError("No hay suficiente stock para reducir")
+        p.cantidad += cantidad
+        self.eventos.emitir("stock_ajustado", producto_id, cantidad=cantidad, stock=p.cantidad)
+        return p
+
+    def listar_productos(self) -> Instantanea:
+        """Devuelve la instantánea actual de productos (inmutable)."""
         return self.productos
 
     def buscar_producto_por_id(self, producto_id: str):
-        for p in self.productos:
-            if p.id == producto_id:
-                return p
-        return None
+        return self._producto_por_id.get(producto_id)
     
+    def buscar_productos_por_ids(self, producto_ids: List[str]) -> Dict[str, Producto]:
+        """Resuelve varios ids de una vez (O(1) cada uno). Devuelve id -> producto para los encontrados."""
+        encontrados = {}
+        for producto_id in producto_ids:
+            p = self._producto_por_id.get(producto_id)
+            if p is not None:
+                encontrados[producto_id] = p
+        return encontrados
+
     def buscar_productos_por_titulo(self, titulo: str):
         encontrados = []
         for p in self.productos:
@@ -132,6 +225,45 @@ class Biblioteca:
                 encontrados.append(p)
         return encontrados
 
+    def _indice_y_codigo(self, producto: Producto):
+        """Índice que corresponde al producto y su código normalizado (None si no tiene uno válido)."""
+        if isinstance(producto, Libro):
+            return self._por_isbn, normalizar_isbn(producto.isbn)
+        if isinstance(producto, CD):
+            return self._por_upc, normalizar_upc(producto.codigo_upc)
+        return None, None
+
+    def _indexar_codigos(self, producto: Producto):
+        # Los productos sin código o con un código inválido no se indexan
+        indice, codigo = self._indice_y_codigo(producto)
+        if codigo:
+            indice.setdefault(codigo, []).append(producto)
+
+    def _desindexar_codigos(self, producto: Producto):
+        indice, codigo = self._indice_y_codigo(producto)
+        productos = indice.get(codigo) if codigo else None
+        if productos and producto in productos:
+            productos.remove(producto)
+            if not productos:
+                del indice[codigo]
+
+    def buscar_producto_por_isbn(self, isbn: str) -> Optional[Producto]:
+        """Busca un libro por ISBN-10 o ISBN-13 (con o sin guiones). Si hay varios, el más antiguo."""
+        productos = self._por_isbn.get(normalizar_isbn(isbn))
+        return productos[0] if productos else None
+
+    def buscar_producto_por_upc(self, codigo: str) -> Optional[Producto]:
+        """Busca un CD por UPC-A o EAN-13. Si hay varios, el más antiguo."""
+        productos = self._por_upc.get(normalizar_upc(codigo))
+        return productos[0] if productos else None
+
+    def buscar_productos_por_codigos(self, codigos: List[str]) -> Dict[str, Optional[Producto]]:
+        """Busca varios códigos (ISBN o UPC/EAN) de una vez. Devuelve código -> producto o None."""
+        resultado = {}
+        for codigo in codigos:
+            resultado[codigo] = self.buscar_producto_por_isbn(codigo) or self.buscar_producto_por_upc(codigo)
+        return resultado
+
     # ==================== PRÉSTAMOS ====================
 
     def registrar_prestamo(self, usuario_id: str, items: List[Tuple[Producto, int]], dias: int = 14):
@@ -144,30 +276,38 @@ class Biblioteca:
             raise ValueError(f"La suscripción de {usuario.nombre} ha expirado.")
 
         productos_validos = []
+        solicitadas: Dict[str, int] = {} # Unidades pedidas por producto en este préstamo
+        es_socio = isinstance(usuario, Socio)
 
+        # Una sola pasada con todas las comprobaciones
         for prod, cant in items:
             if cant <= 0: continue
             
-            # Validación Stock
-            if not prod.esta_disponible(cant):
+            # Validación Stock (acumulando si el mismo producto aparece en varias líneas)
+            total = solicitadas.get(prod.id, 0) + cant
+            if not prod.esta_disponible(total):
                 raise ValueError(f"Sin stock para '{prod.titulo}'.")
 
-            # Validación Edad (DVD)
-            if isinstance(prod, DVD) and isinstance(usuario, Socio):
-                try:
-                    edad_min = int(prod.clasificacion.lstrip("+"))
-                    if usuario.edad < edad_min:
-                        raise ValueError(f"Edad insuficiente para '{prod.titulo}' (+{edad_min}).")
-                except ValueError:
-                    pass
+            # Validación Edad (DVD), con la edad mínima ya calculada al crear el producto
+            if es_socio and isinstance(prod, DVD) and prod.edad_minima is not None \
+                    and usuario.edad < prod.edad_minima:
+                self.estadisticas.registrar_rechazo_edad(prod)
+                raise ValueError(f"Edad insuficiente para '{prod.titulo}' (+{prod.edad_minima}).")
 
+            solicitadas[prod.id] = total
             productos_validos.append((prod, cant))
 
         if not productos_validos:
             raise ValueError("No hay productos válidos para el préstamo.")
 
         prestamo = Prestamo(usuario, productos_validos, dias)
-        self.prestamos.append(prestamo)
+        self._prestamos.añadir(prestamo)
+        self.estadisticas.registrar_prestamo(productos_validos, prestamo.fecha_inicio)
+        self.eventos.emitir("prestamo_creado", prestamo.id,
+                            relacionados=[usuario.id] + [prod.id for prod, _ in productos_validos],
+                            usuario_id=usuario.id,
+                            items=[{"producto_id": prod.id, "cantidad": cant} for prod, cant in productos_validos],
+                            fecha_devolucion=prestamo.fecha_devolucion)
 
         # Restar stock
         for prod, cant in productos_validos:
@@ -179,7 +319,12 @@ class Biblioteca:
         for prestamo in self.prestamos:
             if prestamo.id == prestamo_id:
                 try:
+                    ya_devuelto = prestamo.devuelto
                     mensaje = prestamo.registrar_devolucion() # Esto suma el stock
+                    if not ya_devuelto:
+                        self.estadisticas.registrar_devolucion(prestamo.fecha_inicio, datetime.now())
+                        self.eventos.emitir("prestamo_devuelto", prestamo_id,
+                                            relacionados=[prestamo.socio.id] + [prod.id for prod, _ in prestamo.productos])
                     return mensaje
                 except Exception as e:
                     return str(e)
@@ -189,6 +334,8 @@ class Biblioteca:
         for prestamo in self.prestamos:
             if prestamo.id == prestamo_id:
                 prestamo.ampliar_prestamo(dias)
+                self.eventos.emitir("prestamo_ampliado", prestamo_id, relacionados=[prestamo.socio.id],
+                                    dias=dias, fecha_devolucion=prestamo.fecha_devolucion)
                 return prestamo
         raise ValueError("Préstamo no encontrado")
 
@@ -0,0 +1,150 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from models.Producto import Producto
+
+
+class EstadisticasPrestamos:
+    """
+    Motor de analítica de circulación.
+
+    Mantiene agregados incrementales (totales por producto y agregados por día), de modo
+    que los informes no recorren los préstamos ni guardan cada línea por separado.
+    """
+
+    def __init__(self):
+        # Diccionario de productos: id <-> código entero usado en los agregados
+        self._codigo_producto: Dict[str, int] = {}
+        self._productos: List[Tuple[str, str, str]] = []  # (id, titulo, tipo)
+        self._lineas = 0  # Líneas de préstamo registradas
+
+        # Agregados mantenidos en cada evento
+        self._total_por_producto = array("q")  # Indexado por código de producto
+        self._dias: List[int] = []  # Ordinales con actividad, ordenados
+        self._por_dia_producto: Dict[int, Dict[int, int]] = {}
+        self._por_dia_tipo: Dict[int, Dict[str, int]] = {}
+        self._por_dia_genero: Dict[int, Dict[str, int]] = {}
+        self._dias_prestados_total = 0.0
+        self._devoluciones = 0
+        self._rechazos_edad = 0
+        self._rechazos_edad_por_producto: Dict[int, int] = {}
+
+    # ==================== ALIMENTACIÓN ====================
+
+    def _codificar(self, producto: Producto) -> int:
+        """Devuelve el código entero del producto, registrándolo si es nuevo."""
+        codigo = self._codigo_producto.get(producto.id)
+        if codigo is None:
+            codigo = len(self._productos)
+            self._codigo_producto[producto.id] = codigo
+            self._productos.append((producto.id, producto.titulo, type(producto).__name__))
+            self._total_por_producto.append(0)
+        return codigo
+
+    def registrar_prestamo(self, productos: List[Tuple[Producto, int]], fecha: datetime):
+        """Añade las líneas de un préstamo y actualiza los agregados."""
+        dia = fecha.toordinal()
+        if dia not in self._por_dia_producto:
+            insort(self._dias, dia)
+            self._por_dia_producto[dia] = {}
+            self._por_dia_tipo[dia] = {}
+            self._por_dia_genero[dia] = {}
+        por_producto = self._por_dia_producto[dia]
+        por_tipo = self._por_dia_tipo[dia]
+        por_genero = self._por_dia_genero[dia]
+
+        for prod, cant in productos:
+            codigo = self._codificar(prod)
+            self._lineas += 1
+
+            self._total_por_producto[codigo] += cant
+            por_producto[codigo] = por_producto.get(codigo, 0) + cant
+            tipo = type(prod).__name__
+            por_tipo[tipo] = por_tipo.get(tipo, 0) + cant
+            genero = getattr(prod, "genero", None)
+            if genero:
+                por_genero[genero] = por_genero.get(genero, 0) + cant
+
+    def registrar_devolucion(self, fecha_inicio: datetime, fecha_devolucion: datetime):
+        """Acumula la duración de un préstamo devuelto."""
+        self._dias_prestados_total += (fecha_devolucion - fecha_inicio).total_seconds() / 86400
+        self._devoluciones += 1
+
+    def registrar_rechazo_edad(self, producto: Producto):
+        """Cuenta un préstamo rechazado por la clasificación de edad de un DVD."""
+        codigo = self._codificar(producto)
+        self._rechazos_edad += 1
+        self._rechazos_edad_por_producto[codigo] = self._rechazos_edad_por_producto.get(codigo, 0) + 1
+
+    # ==================== INFORMES ====================
+
+    def mas_prestados(self, limite: int = 10, desde: Optional[date] = None,
+                      hasta: Optional[date] = None) -> List[dict]:
+        """
+        Top de productos por unidades prestadas.
+        Sin rango de fechas usa el agregado total; con rango suma los agregados diarios del intervalo.
+        """
+        if desde is None and hasta is None:
+            totales = enumerate(self._total_por_producto)
+        else:
+            totales = self._totales_en_rango(desde, hasta).items()
+
+        resultado = []
+        for codigo, unidades in heapq.nlargest(limite, totales, key=lambda x: x[1]):
+            if not unidades:
+                break
+            producto_id, titulo, tipo = self._productos[codigo]
+            resultado.append({"producto_id": producto_id, "titulo": titulo, "tipo": tipo,
+                              "unidades": unidades})
+        return resultado
+
+    def _dias_en_rango(self, desde: Optional[date], hasta: Optional[date]) -> List[int]:
+        """Ordinales con actividad entre dos fechas (incluidas)."""
+        inicio = bisect_left(self._dias, desde.toordinal()) if desde else 0
+        fin = bisect_right(self._dias, hasta.toordinal()) if hasta else len(self._dias)
+        return self._dias[inicio:fin]
+
+    def _totales_en_rango(self, desde: Optional[date], hasta: Optional[date]) -> Dict[int, int]:
+        """Suma unidades por producto entre dos fechas, a partir de los agregados diarios."""
+        totales: Dict[int, int] = {}
+        for dia in self._dias_en_rango(desde, hasta):
+            for codigo, unidades in self._por_dia_producto[dia].items():
+                totales[codigo] = totales.get(codigo, 0) + unidades
+        return totales
+
+    def prestamos_por_dia(self, agrupacion: str = "tipo", desde: Optional[date] = None,
+                          hasta: Optional[date] = None) -> List[dict]:
+        """Unidades prestadas por día y tipo (o género), opcionalmente entre dos fechas."""
+        if agrupacion == "tipo":
+            datos = self._por_dia_tipo
+        elif agrupacion == "genero":
+            datos = self._por_dia_genero
+        else:
+            raise ValueError("Agrupación no válida. Debe ser 'tipo' o 'genero'.")
+
+        resultado = []
+        for dia in self._dias_en_rango(desde, hasta):
+            fecha = date.fromordinal(dia).isoformat()
+            for clave, unidades in sorted(datos[dia].items()):
+                resultado.append({"fecha": fecha, agrupacion: clave, "unidades": unidades})
+        return resultado
+
+    def duracion_media(self) -> dict:
+        """Duración media en días de los préstamos devueltos."""
+        media = self._dias_prestados_total / self._devoluciones if self._devoluciones else 0.0
+        return {"devoluciones": self._devoluciones, "dias_media": round(media, 2)}
+
+    def rechazos_edad(self) -> dict:
+        """Total de rechazos por edad y desglose por producto."""
+        por_producto = []
+        for codigo, total in sorted(self._rechazos_edad_por_producto.items(), key=lambda x: -x[1]):
+            producto_id, titulo, _ = self._productos[codigo]
+            por_producto.append({"producto_id": producto_id, "titulo": titulo, "rechazos": total})
+        return {"total": self._rechazos_edad, "por_producto": por_producto}
+
+    def __len__(self) -> int:
+        """Número de líneas de préstamo registradas."""
+        return self._lineas
@@ -0,0 +1,60 @@
+from typing import Optional
+
+
+def _limpiar(codigo: str) -> str:
+    """Quita guiones y espacios y pasa a mayúsculas."""
+    return "".join(c for c in codigo if c not in "- ").upper()
+
+
+def _digito_control_ean(digitos: str) -> int:
+    """Dígito de control EAN/UPC para los dígitos dados (sin el de control)."""
+    suma = 0
+    for i, d in enumerate(reversed(digitos)):
+        suma += int(d) * (3 if i % 2 == 0 else 1)
+    return (10 - suma % 10) % 10
+
+
+def normalizar_isbn(codigo: Optional[str]) -> Optional[str]:
+    """
+    Devuelve el ISBN-13 canónico (solo dígitos) de un ISBN-10 o ISBN-13.
+    Devuelve None si el código no es un ISBN válido.
+    """
+    if not codigo:
+        return None
+    codigo = _limpiar(codigo)
+
+    if len(codigo) == 10:
+        if not codigo[:9].isdigit() or not (codigo[9].isdigit() or codigo[9] == "X"):
+            return None
+        suma = sum((10 - i) * int(d) for i, d in enumerate(codigo[:9]))
+        suma += 10 if codigo[9] == "X" else int(codigo[9])
+        if suma % 11 != 0:
+            return None
+        base = "978" + codigo[:9]
+        return base + str(_digito_control_ean(base))
+
+    if len(codigo) == 13 and codigo.isdigit() and codigo[:3] in ("978", "979"):
+        if _digito_control_ean(codigo[:12]) != int(codigo[12]):
+            return None
+        return codigo
+
+    return None
+
+
+def normalizar_upc(codigo: Optional[str]) -> Optional[str]:
+    """
+    Devuelve el EAN-13 canónico de un UPC-A (12 dígitos) o EAN-13.
+    Devuelve None si el código no es válido.
+    """
+    if not codigo:
+        return None
+    codigo = _limpiar(codigo)
+    if not codigo.isdigit():
+        return None
+    if len(codigo) == 12:
+        codigo = "0" + codigo # Un UPC-A es un EAN-13 que empieza por 0
+    if len(codigo) != 13:
+        return None
+    if _digito_control_ean(codigo[:12]) != int(codigo[12]):
+        return None
+    return codigo
@@ -0,0 +1,112 @@
+import threading
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+TAM_BLOQUE = 128
+
+
+class Instantanea:
+    """
+    Versión inmutable de una colección.
+
+    Los elementos se guardan en bloques (tuplas) de hasta TAM_BLOQUE elementos. Cada
+    escritura crea una instantánea nueva que comparte con la anterior todos los bloques
+    que no cambian, así que publicar una versión cuesta copiar un bloque y el índice
+    de bloques, no la colección entera.
+    """
+
+    __slots__ = ("version", "_bloques", "_longitud")
+
+    def __init__(self, version: int = 0, bloques: Tuple[tuple, ...] = (), longitud: int = 0):
+        self.version = version
+        self._bloques = bloques
+        self._longitud = longitud
+
+    def añadir(self, elemento: Any) -> "Instantanea":
+        """Devuelve una instantánea nueva con el elemento añadido al final."""
+        bloques = self._bloques
+        if bloques and len(bloques[-1]) < TAM_BLOQUE:
+            bloques = bloques[:-1] + (bloques[-1] + (elemento,),)
+        else:
+            bloques = bloques + ((elemento,),)
+        return Instantanea(self.version + 1, bloques, self._longitud + 1)
+
+    def eliminar_si(self, condicion: Callable[[Any], bool]) -> Tuple["Instantanea", Optional[Any]]:
+        """
+        Quita el primer elemento que cumple la condición.
+        Devuelve (instantánea nueva, elemento quitado) o (self, None) si ninguno la cumple.
+        """
+        for i, bloque in enumerate(self._bloques):
+            for j, elemento in enumerate(bloque):
+                if condicion(elemento):
+                    nuevo = bloque[:j] + bloque[j + 1:]
+                    bloques = self._bloques[:i] + ((nuevo,) if nuevo else ()) + self._bloques[i + 1:]
+                    return Instantanea(self.version + 1, bloques, self._longitud - 1), elemento
+        return self, None
+
+    def __iter__(self) -> Iterator:
+        for bloque in self._bloques:
+            yield from bloque
+
+    def __len__(self) -> int:
+        return self._longitud
+
+    def __getitem__(self, indice):
+        """Admite índices y slices (útil para paginar)."""
+        if isinstance(indice, slice):
+            return self._trozo(indice)
+        if indice < 0:
+            indice += self._longitud
+        if not 0 <= indice < self._longitud:
+            raise IndexError("Índice fuera de rango")
+        for bloque in self._bloques:
+            if indice < len(bloque):
+                return bloque[indice]
+            indice -= len(bloque)
+
+    def _trozo(self, indice: slice) -> list:
+        """Slice recorriendo solo los bloques que caen dentro de los límites."""
+        inicio, fin, paso = indice.indices(self._longitud)
+        if paso < 0:
+            return list(self)[indice] # Poco habitual: no merece un recorrido propio
+
+        resultado = []
+        siguiente = inicio # Próxima posición global a copiar
+        base = 0 # Posición global del primer elemento del bloque actual
+        for bloque in self._bloques:
+            if siguiente >= fin:
+                break
+            tam = len(bloque)
+            if siguiente < base + tam:
+                trozo = bloque[siguiente - base:min(fin, base + tam) - base:paso]
+                resultado.extend(trozo)
+                siguiente += len(trozo) * paso
+            base += tam
+        return resultado
+
+    def __repr__(self) -> str:
+        return f"Instantanea(version={self.version}, elementos={self._longitud})"
+
+
+class ColeccionVersionada:
+    """
+    Colección con copy-on-write: los lectores toman la instantánea actual sin bloqueos y
+    los escritores publican una versión nueva reasignando una sola referencia.
+    """
+
+    def __init__(self):
+        self._actual = Instantanea()
+        self._lock = threading.Lock() # Solo serializa a los escritores
+
+    def instantanea(self) -> Instantanea:
+        """Versión vigente. No cambia aunque otros hilos escriban mientras se recorre."""
+        return self._actual
+
+    def añadir(self, elemento: Any):
+        with self._lock:
+            self._actual = self._actual.añadir(elemento)
+
+    def eliminar_si(self, condicion: Callable[[Any], bool]) -> Optional[Any]:
+        """Busca y quita, bajo el mismo bloqueo, el primer elemento que cumple la condición."""
+        with self._lock:
+            self._actual, eliminado = self._actual.eliminar_si(condicion)
+            return eliminado
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LimitadorIntentos:
+    """
+    Limitador por clave (email, IP...) basado en token buckets.
+
+    Cada clave tiene un cubo de `capacidad` fichas que se recarga de forma continua,
+    lo que equivale a una ventana deslizante. Las claves se guardan en orden LRU y
+    las menos usadas se expulsan al superar `max_claves`, así la memoria está acotada.
+    """
+
+    def __init__(self, capacidad: int, recarga_por_segundo: float, max_claves: int = 10000):
+        """
+        :param capacidad: Número máximo de intentos seguidos permitidos
+        :param recarga_por_segundo: Fichas que se recuperan por segundo
+        :param max_claves: Número máximo de claves vigiladas a la vez
+        """
+        self.capacidad = capacidad
+        self.recarga_por_segundo = recarga_por_segundo
+        self.max_claves = max_claves
+        self._cubos: "OrderedDict[str, list]" = OrderedDict()  # clave -> [fichas, marca]
+        self._lock = threading.Lock()
+
+    def consumir(self, clave: str) -> float:
+        """
+        Intenta gastar una ficha de la clave.
+        Devuelve 0 si se permite el intento o los segundos a esperar si se rechaza.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            cubo = self._cubos.get(clave)
+            if cubo is None:
+                cubo = [float(self.capacidad), ahora]
+                self._cubos[clave] = cubo
+                if len(self._cubos) > self.max_claves:
+                    self._cubos.popitem(last=False) # Expulsamos la clave menos reciente
+            else:
+                self._cubos.move_to_end(clave)
+                transcurrido = ahora - cubo[1]
+                cubo[0] = min(self.capacidad, cubo[0] + transcurrido * self.recarga_por_segundo)
+                cubo[1] = ahora
+
+            if cubo[0] >= 1:
+                cubo[0] -= 1
+                return 0.0
+            return (1 - cubo[0]) / self.recarga_por_segundo
+
+    def reiniciar(self, clave: str):
+        """Olvida el historial de una clave (p. ej. tras un login correcto)."""
+        with self._lock:
+            self._cubos.pop(clave, None)
+
+    def __len__(self) -> int:
+        return len(self._cubos)
@@ -0,0 +1,54 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from models.Usuario import Socio
+
+
+class IndiceVencimientos:
+    """
+    Índice de socios ordenado por fecha de renovación.
+
+    Guarda una lista ordenada de (fecha_renovacion, id) para responder "quién vence
+    entre dos fechas" con dos búsquedas binarias, y un diccionario id -> socio.
+    """
+
+    def __init__(self):
+        self._claves: List[Tuple[datetime, str]] = []
+        self._socios: Dict[str, Socio] = {}
+        self._lock = threading.Lock()
+
+    def añadir(self, socio: Socio):
+        with self._lock:
+            insort(self._claves, (socio.fecha_renovacion, socio.id))
+            self._socios[socio.id] = socio
+
+    def eliminar(self, socio: Socio):
+        with self._lock:
+            self._quitar_clave(socio.fecha_renovacion, socio.id)
+            self._socios.pop(socio.id, None)
+
+    def actualizar(self, socio: Socio, fecha_anterior: datetime):
+        """Recoloca al socio tras cambiar su fecha de renovación."""
+        with self._lock:
+            self._quitar_clave(fecha_anterior, socio.id)
+            insort(self._claves, (socio.fecha_renovacion, socio.id))
+
+    def _quitar_clave(self, fecha: datetime, socio_id: str):
+        i = bisect_left(self._claves, (fecha, socio_id))
+        if i < len(self._claves) and self._claves[i] == (fecha, socio_id):
+            del self._claves[i]
+
+    def obtener(self, socio_id: str) -> Optional[Socio]:
+        return self._socios.get(socio_id)
+
+    def entre(self, desde: Optional[datetime], hasta: datetime) -> List[Socio]:
+        """Socios cuya fecha de renovación está en [desde, hasta], de la más próxima a la más lejana."""
+        with self._lock:
+            inicio = bisect_left(self._claves, (desde, "")) if desde else 0
+            fin = bisect_right(self._claves, (hasta, "\uffff"))
+            return [self._socios[socio_id] for _, socio_id in self._claves[inicio:fin]]
+
+    def __len__(self) -> int:
+        return len(self._claves)